@@ -0,0 +1,385 @@
+import os
+import selectors
+import socket
+import stat
+import struct
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# 封包格式（little-endian）：
+#   header  : magic(4s) seq(uint32) count(uint16) addr_len(uint8)
+#   address : addr_len bytes (ASCII)
+#   samples : count x [timestamp(float64, epoch 秒) ax ay az gx gy gz(int16)]
+FRAME_MAGIC = b"IMUS"
+FRAME_HEADER = struct.Struct("<4sIHB")
+SAMPLE = struct.Struct("<d6h")
+SAMPLE_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("ax", "<i2"),
+    ("ay", "<i2"),
+    ("az", "<i2"),
+    ("gx", "<i2"),
+    ("gy", "<i2"),
+    ("gz", "<i2"),
+])
+IMU_PAYLOAD = struct.Struct("<6h")
+
+DEFAULT_STREAM_URL = "tcp://127.0.0.1:9750"
+UDP_SUBSCRIBE = b"SUB"
+UDP_UNSUBSCRIBE = b"UNSUB"
+UDP_KEEPALIVE_INTERVAL = 1.0  # 客戶端重送 SUB 的間隔（秒）
+
+
+def parse_stream_url(url):
+    parts = urlsplit(url)
+    if parts.scheme in ("tcp", "udp"):
+        return parts.scheme, (parts.hostname or "127.0.0.1", parts.port or 9750)
+    if parts.scheme == "unix":
+        if not parts.path:
+            raise ValueError(f"Unix stream URL needs a path, e.g. unix:///tmp/imu.sock: {url}")
+        return "unix", parts.path
+    raise ValueError(f"Unsupported stream URL: {url}")
+
+
+def encode_frame(seq, address, samples):
+    address = address.encode("ascii", "replace")[:255]
+    frame = bytearray(FRAME_HEADER.pack(FRAME_MAGIC, seq & 0xFFFFFFFF, len(samples), len(address)))
+    frame += address
+    for timestamp, data in samples:
+        if len(data) < IMU_PAYLOAD.size:
+            data = bytes(data).ljust(IMU_PAYLOAD.size, b"\0")  # 長度不足的通知補零，與 parse_imu_data 一致
+        frame += SAMPLE.pack(timestamp, *IMU_PAYLOAD.unpack_from(data))
+    return bytes(frame)
+
+
+def decode_frame(buffer):
+    magic, seq, count, addr_len = FRAME_HEADER.unpack_from(buffer)
+    if magic != FRAME_MAGIC:
+        raise ValueError("Invalid IMU stream frame")
+    offset = FRAME_HEADER.size
+    address = bytes(buffer[offset:offset + addr_len]).decode("ascii")
+    samples = np.frombuffer(buffer, dtype=SAMPLE_DTYPE, count=count, offset=offset + addr_len)
+    return seq, address, samples
+
+
+class IMUStreamPublisher:
+    """把 Motion measurement 解碼後的樣本批次推送到本機 socket（TCP/UDP/Unix）。
+
+    consumer 是 NotificationRouter 的非執行緒消費者，由本物件的執行緒輪詢。
+    TCP/Unix 客戶端的待送緩衝超過 max_client_buffer 時直接斷線；
+    UDP 客戶端送出 b"SUB" 訂閱並定期重送作為 keepalive、b"UNSUB" 取消；
+    超過 udp_timeout 秒沒有 keepalive，或連續 max_send_failures 次送不出去的訂閱者會被移除。
+    """
+
+    def __init__(self, url, consumer, max_batch=64, flush_interval=0.02, max_client_buffer=256 * 1024,
+                 udp_timeout=5.0, max_send_failures=10, log=None):
+        self.url = url
+        self.kind, self.bind_address = parse_stream_url(url)
+        self.consumer = consumer
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_client_buffer = max_client_buffer
+        self.udp_timeout = udp_timeout
+        self.max_send_failures = max_send_failures
+        self.log = log or (lambda message: print(message))
+        self.address = ""
+        self.seq = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.clients_dropped = 0
+        self.short_payloads = 0
+        self.publish_errors = 0
+        self._clients = {}
+        self._selector = None
+        self._sock = None
+        self._unix_inode = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def set_address(self, address):
+        self.address = address or ""
+
+    def start(self):
+        if self.kind == "tcp":
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        elif self.kind == "udp":
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            if not hasattr(socket, "AF_UNIX"):
+                raise ValueError("Unix sockets are not supported on this platform")
+            self._remove_stale_unix_socket()
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            if self.kind == "tcp":
+                # Windows 的 SO_REUSEADDR 允許第二個程式綁定同一個埠，改用 SO_EXCLUSIVEADDRUSE
+                if os.name == "nt":
+                    self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+                else:
+                    self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._sock.bind(self.bind_address)
+            if self.kind == "unix":
+                self._unix_inode = os.stat(self.bind_address).st_ino
+            if self.kind != "udp":
+                self._sock.listen()
+            self._sock.setblocking(False)
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self._sock, selectors.EVENT_READ)
+        except Exception:
+            # 啟動失敗時關閉 socket，避免呼叫端丟棄物件後洩漏
+            if self._selector:
+                self._selector.close()
+                self._selector = None
+            self._sock.close()
+            self._sock = None
+            raise
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="imu-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+        for client in list(self._clients):
+            self._close_client(client)
+        if self._selector:
+            self._selector.close()
+            self._selector = None
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        if self.kind == "unix" and self._unix_inode is not None:
+            # 只移除自己建立的 socket 檔
+            try:
+                if os.stat(self.bind_address).st_ino == self._unix_inode:
+                    os.unlink(self.bind_address)
+            except FileNotFoundError:
+                pass
+            self._unix_inode = None
+
+    def stats(self):
+        return {
+            "clients": len(self._clients),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "clients_dropped": self.clients_dropped,
+            "short_payloads": self.short_payloads,
+            "publish_errors": self.publish_errors,
+        }
+
+    def _remove_stale_unix_socket(self):
+        # 只移除沒有程式在監聽的殘留 socket；一般檔案或仍在使用中的 socket 一律不動
+        try:
+            mode = os.stat(self.bind_address).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise OSError(f"{self.bind_address} exists and is not a socket")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.bind_address)
+        except ConnectionRefusedError:
+            os.unlink(self.bind_address)
+            return
+        finally:
+            probe.close()
+        raise OSError(f"{self.bind_address} is already in use by another publisher")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            for key, mask in self._selector.select(timeout=self.flush_interval):
+                try:
+                    if key.fileobj is self._sock:
+                        self._on_server_readable()
+                    elif mask & selectors.EVENT_READ and not key.fileobj.recv(4096):
+                        self._close_client(key.fileobj)
+                    elif mask & selectors.EVENT_WRITE:
+                        self._flush_client(key.fileobj)
+                except OSError:
+                    if key.fileobj is not self._sock:
+                        self._close_client(key.fileobj)
+            if self.kind == "udp":
+                self._expire_udp_clients()
+            try:
+                self._publish(self.consumer.drain())
+            except Exception as e:
+                self.publish_errors += 1
+                self.log(f"IMU stream publish failed: {e}")
+
+    def _on_server_readable(self):
+        if self.kind == "udp":
+            data, peer = self._sock.recvfrom(64)
+            if data == UDP_SUBSCRIBE:
+                if peer not in self._clients:
+                    self.log(f"IMU stream subscriber {peer} added")
+                self._clients[peer] = {"last_seen": time.monotonic(), "failures": 0}
+            elif data == UDP_UNSUBSCRIBE:
+                self._clients.pop(peer, None)
+            return
+        client, _ = self._sock.accept()
+        client.setblocking(False)
+        self._clients[client] = bytearray()
+        self._selector.register(client, selectors.EVENT_READ)
+        self.log(f"IMU stream client connected ({len(self._clients)} total)")
+
+    def _expire_udp_clients(self):
+        now = time.monotonic()
+        for peer, state in list(self._clients.items()):
+            if now - state["last_seen"] > self.udp_timeout:
+                self._drop_udp_client(peer, "keepalive timed out")
+
+    def _drop_udp_client(self, peer, reason):
+        self._clients.pop(peer, None)
+        self.clients_dropped += 1
+        self.log(f"IMU stream subscriber {peer} dropped: {reason}")
+
+    def _publish(self, items):
+        if not items or not self._clients:
+            return
+        self.short_payloads += sum(1 for _, data in items if len(data) < IMU_PAYLOAD.size)
+        for start in range(0, len(items), self.max_batch):
+            frame = encode_frame(self.seq, self.address, items[start:start + self.max_batch])
+            self.seq += 1
+            for client in list(self._clients):
+                self._send(client, frame)
+
+    def _send(self, client, frame):
+        if self.kind == "udp":
+            state = self._clients[client]
+            try:
+                self._sock.sendto(frame, client)
+                self.frames_sent += 1
+                state["failures"] = 0
+            except OSError:
+                self.frames_dropped += 1
+                state["failures"] += 1
+                if state["failures"] >= self.max_send_failures:
+                    self._drop_udp_client(client, "send failed repeatedly")
+            return
+        pending = self._clients[client]
+        if len(pending) + len(frame) > self.max_client_buffer:
+            self.clients_dropped += 1
+            self.log("IMU stream client too slow, dropped")
+            self._close_client(client)
+            return
+        pending += frame
+        self.frames_sent += 1
+        try:
+            self._flush_client(client)
+        except OSError:
+            self._close_client(client)
+
+    def _flush_client(self, client):
+        pending = self._clients.get(client)
+        if pending is None:
+            return
+        try:
+            sent = client.send(pending)
+        except BlockingIOError:
+            sent = 0
+        del pending[:sent]
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if pending else selectors.EVENT_READ
+        self._selector.modify(client, events)
+
+    def _close_client(self, client):
+        self._clients.pop(client, None)
+        if self.kind == "udp":
+            return
+        try:
+            self._selector.unregister(client)
+        except (KeyError, ValueError):
+            pass
+        client.close()
+
+
+class IMUStreamClient:
+    """IMUStreamPublisher 的客戶端，每個封包解碼成 SAMPLE_DTYPE 的 NumPy 陣列。"""
+
+    def __init__(self, url=DEFAULT_STREAM_URL, timeout=None):
+        self.kind, self.address = parse_stream_url(url)
+        if self.kind == "unix":
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        elif self.kind == "udp":
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.timeout = timeout
+        self.sock.settimeout(timeout)
+        self.sock.connect(self.address)
+        self._last_subscribe = 0.0
+        if self.kind == "udp":
+            self._subscribe()
+
+    def _subscribe(self):
+        self.sock.send(UDP_SUBSCRIBE)
+        self._last_subscribe = time.monotonic()
+
+    def _recv_datagram(self):
+        # 等待期間定期重送 SUB，避免發佈端因 keepalive 逾時移除訂閱
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            now = time.monotonic()
+            if now - self._last_subscribe >= UDP_KEEPALIVE_INTERVAL:
+                self._subscribe()
+            wait = UDP_KEEPALIVE_INTERVAL - (now - self._last_subscribe)
+            if deadline is not None:
+                if now >= deadline:
+                    raise socket.timeout("timed out")
+                wait = min(wait, deadline - now)
+            self.sock.settimeout(max(wait, 0.001))
+            try:
+                return self.sock.recv(65535)
+            except socket.timeout:
+                continue
+
+    def _recv_exact(self, size):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        while view:
+            received = self.sock.recv_into(view)
+            if not received:
+                raise ConnectionError("IMU stream closed")
+            view = view[received:]
+        return buffer
+
+    def recv_frame(self):
+        """回傳 (seq, address, samples)。"""
+        if self.kind == "udp":
+            return decode_frame(self._recv_datagram())
+        header = self._recv_exact(FRAME_HEADER.size)
+        _, _, count, addr_len = FRAME_HEADER.unpack(header)
+        return decode_frame(header + self._recv_exact(addr_len + count * SAMPLE.size))
+
+    def __iter__(self):
+        while True:
+            yield self.recv_frame()
+
+    def close(self):
+        if self.kind == "udp":
+            try:
+                self.sock.send(UDP_UNSUBSCRIBE)
+            except OSError:
+                pass
+        self.sock.close()
+
+
+if __name__ == "__main__":
+    client = IMUStreamClient(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_STREAM_URL)
+    last_seq = None
+    try:
+        for seq, address, samples in client:
+            if last_seq is not None and seq != last_seq + 1:
+                print(f"Missed {seq - last_seq - 1} frames")
+            last_seq = seq
+            latency_ms = (time.time() - samples["timestamp"][-1]) * 1000
+            print(f"#{seq} {address}: {len(samples)} samples, latest AX={samples['ax'][-1]} "
+                  f"AY={samples['ay'][-1]} AZ={samples['az'][-1]}, latency {latency_ms:.1f} ms")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
@@ -1,6 +1,7 @@
 import asyncio
 import threading
 import queue
+import time
 from bleak import BleakScanner, BleakClient
 from colorama import init, Fore
 from datetime import datetime
@@ -10,6 +11,7 @@ from tkinter import ttk
 from tkinter.font import Font
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from imu_stream import IMUStreamPublisher
 
 # 初始化 colorama
 init(autoreset=True)
@@ -37,6 +39,8 @@ IMU_CONFIG_RX_UUID= "0000fff7-0000-1000-8000-00805f9b34fb"  # FAKE IMU CONFIG RX
 
 
 MAC_FILE_PATH = "MacID.txt"
+IMU_STREAM_URL = os.environ.get("BLETOOLS_IMU_STREAM", "tcp://127.0.0.1:9750")  # 設為空字串可關閉即時串流
+imu_publisher = None
 button_pushed_count = 0
 imu_data_received = False
 recording = False
@@ -54,9 +58,176 @@ imu_data = {
     "gy": [],
     "gz": []
 }
+imu_data_lock = threading.Lock()  # recorder 執行緒寫入，Tk 執行緒清除與存檔
+
+# 通知分派策略
+POLICY_BLOCK = "block"              # 在通知回調中直接處理，不經佇列也不丟資料；handler 必須夠快
+POLICY_DROP_OLDEST = "drop_oldest"  # 佇列滿時丟棄最舊的資料
+POLICY_SAMPLE = "sample"            # 每 N 筆取 1 筆，佇列滿時丟棄新資料
+
+
+class NotificationConsumer:
+    """單一消費者：擁有自己的有界佇列與分派策略，並記錄延遲計數。"""
+
+    def __init__(self, name, handler=None, policy=POLICY_DROP_OLDEST, maxsize=256, sample_every=1):
+        if policy not in (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_SAMPLE):
+            raise ValueError(f"Unknown notification policy: {policy}")
+        self.name = name
+        self.handler = handler
+        self.policy = policy
+        self.sample_every = max(1, sample_every)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.skipped = 0
+        self._counter_lock = threading.Lock()  # delivered 由消費者執行緒遞增，重置時需同步
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def offer(self, item):
+        # 只由通知回調執行緒（bleak 的 asyncio 迴圈）呼叫；除了 block 之外都不可阻塞
+        self.received += 1
+        if self.policy == POLICY_SAMPLE:
+            if (self.received - 1) % self.sample_every:
+                self.skipped += 1
+                return
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+        elif self.policy == POLICY_BLOCK:
+            self._deliver(item)
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def drain(self):
+        # 由擁有者（例如 Tk 的 after 迴圈）輪詢取出所有待處理資料
+        items = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self._deliver(item)
+            items.append(item)
+        return items
+
+    def _deliver(self, item):
+        if self.handler:
+            try:
+                self.handler(*item)
+            except Exception as e:
+                print_to_terminal(f"Consumer {self.name} failed: {e}", Fore.RED)
+        with self._counter_lock:
+            self.delivered += 1
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                item = self.queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            self._deliver(item)
 
-# 創建隊列用於從回調中傳遞IMU數據
-imu_queue = queue.Queue()
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"consumer-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    def reset_counters(self):
+        # 上一輪殘留的資料直接丟棄並計入 dropped，計數只反映新的一輪
+        with self._counter_lock:
+            discarded = 0
+            while True:
+                try:
+                    self.queue.get_nowait()
+                    discarded += 1
+                except queue.Empty:
+                    break
+            self.received = 0
+            self.delivered = 0
+            self.dropped = discarded
+            self.skipped = 0
+
+    @property
+    def lag(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "lag": self.lag,
+        }
+
+
+class NotificationRouter:
+    """依特徵 UUID 管理訂閱，將原始通知資料分派給各消費者。"""
+
+    def __init__(self):
+        self.subscriptions = {}
+
+    def subscribe(self, char_uuid, name, handler=None, threaded=True, **kwargs):
+        consumer = NotificationConsumer(name, handler, **kwargs)
+        consumers = self.subscriptions.setdefault(char_uuid, {})
+        if name in consumers:
+            consumers[name].stop()
+        consumers[name] = consumer
+        if threaded and handler and consumer.policy != POLICY_BLOCK:
+            consumer.start()
+        return consumer
+
+    def unsubscribe(self, char_uuid, name):
+        consumer = self.subscriptions.get(char_uuid, {}).pop(name, None)
+        if consumer:
+            consumer.stop()
+
+    def dispatch(self, char_uuid, data):
+        item = (time.time(), bytes(data))
+        for consumer in list(self.subscriptions.get(char_uuid, {}).values()):
+            consumer.offer(item)
+
+    async def start_notify(self, client, char_uuid):
+        await client.start_notify(char_uuid, lambda sender, data: self.dispatch(char_uuid, data))
+
+    async def stop_notify(self, client, char_uuid):
+        await client.stop_notify(char_uuid)
+
+    def lag_counters(self, char_uuid):
+        return {name: consumer.stats() for name, consumer in self.subscriptions.get(char_uuid, {}).items()}
+
+    def reset_counters(self, char_uuid):
+        for consumer in self.subscriptions.get(char_uuid, {}).values():
+            consumer.reset_counters()
+
+    def close(self):
+        for consumers in self.subscriptions.values():
+            for consumer in consumers.values():
+                consumer.stop()
+
+
+router = NotificationRouter()
 
 async def scan_devices():
     print_to_terminal("Scanning for devices...", Fore.BLACK)
@@ -228,7 +399,7 @@ async def set_monitor_imu(client, value):
 
 
 
-def button_callback(sender: int, data: bytearray):
+def button_callback(timestamp, data):
     global button_pushed_count
     if data[0] in [0x01, 0x10, 0x11]:
         button_pushed_count += 1
@@ -239,14 +410,15 @@ def button_callback(sender: int, data: bytearray):
 async def monitor_button(client):
     global button_pushed_count
     button_pushed_count = 0
+    router.reset_counters(BUTTON_CHAR_UUID)
     print_to_terminal("Press any button twice to continue...", Fore.BLACK)
     try:
-        await client.start_notify(BUTTON_CHAR_UUID, button_callback)
+        await router.start_notify(client, BUTTON_CHAR_UUID)
         while button_pushed_count < 2:
             await asyncio.sleep(0.1)
             if disconnect_event.is_set():
                 break
-        await client.stop_notify(BUTTON_CHAR_UUID)
+        await router.stop_notify(client, BUTTON_CHAR_UUID)
     except Exception as e:
         print_to_terminal(f"Failed to monitor button: {e}", Fore.RED)
 
@@ -261,39 +433,90 @@ def parse_imu_data(data):
     gz = int.from_bytes(data[10:12], byteorder='little', signed=True)
     return ax, ay, az, gx, gy, gz
 
-def imu_callback(sender: int, data: bytearray):
-    global imu_data_received, recording
-    imu_data_received = True
+def format_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+def record_imu(timestamp, data):
     ax, ay, az, gx, gy, gz = parse_imu_data(data)
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-    imu_data["timestamps"].append(timestamp)
-    imu_data["ax"].append(ax)
-    imu_data["ay"].append(ay)
-    imu_data["az"].append(az)
-    imu_data["gx"].append(gx)
-    imu_data["gy"].append(gy)
-    imu_data["gz"].append(gz)
-    print_to_terminal(f"IMU data: {timestamp} AX={ax}, AY={ay}, AZ={az}, GX={gx}, GY={gy}, GZ={gz}", Fore.BLACK)
-    imu_queue.put((timestamp, ax, ay, az, gx, gy, gz))  # 將數據放入隊列中
-    if imu_data_received:
+    with imu_data_lock:
+        imu_data["timestamps"].append(format_timestamp(timestamp))
+        imu_data["ax"].append(ax)
+        imu_data["ay"].append(ay)
+        imu_data["az"].append(az)
+        imu_data["gx"].append(gx)
+        imu_data["gy"].append(gy)
+        imu_data["gz"].append(gz)
+
+def check_imu(timestamp, data):
+    global imu_data_received
+    if not imu_data_received:
+        imu_data_received = True
         app.update_checkbutton(app.imu_checkbutton, True, "IMU: Pass")
 
+def log_imu(timestamp, data):
+    ax, ay, az, gx, gy, gz = parse_imu_data(data)
+    print_to_terminal(f"IMU data: {format_timestamp(timestamp)} AX={ax}, AY={ay}, AZ={az}, GX={gx}, GY={gy}, GZ={gz}", Fore.BLACK)
+
+def print_lag_counters(char_uuid):
+    for name, stats in router.lag_counters(char_uuid).items():
+        print_to_terminal(
+            f"{name}: received={stats['received']}, delivered={stats['delivered']}, "
+            f"dropped={stats['dropped']}, skipped={stats['skipped']}, lag={stats['lag']}", Fore.CYAN
+        )
+
+# 按鈕與 IMU 通知的消費者；block 在通知回調中直接處理，plot 由 Tk 的 update_plot 輪詢，其餘各自在背景執行緒處理
+router.subscribe(BUTTON_CHAR_UUID, "checks", button_callback, policy=POLICY_BLOCK)
+router.subscribe(MOTION_MEASUREMENT_CHAR_UUID, "recorder", record_imu, policy=POLICY_BLOCK)
+plot_consumer = router.subscribe(MOTION_MEASUREMENT_CHAR_UUID, "plot", threaded=False, policy=POLICY_DROP_OLDEST, maxsize=256)
+router.subscribe(MOTION_MEASUREMENT_CHAR_UUID, "checks", check_imu, policy=POLICY_SAMPLE, maxsize=8, sample_every=50)
+router.subscribe(MOTION_MEASUREMENT_CHAR_UUID, "logger", log_imu, policy=POLICY_DROP_OLDEST, maxsize=256)
+
 async def monitor_imu(client):
     global imu_data_received, recording, stop_monitoring
     imu_data_received = False
     recording = True
     stop_monitoring = False
+    router.reset_counters(MOTION_MEASUREMENT_CHAR_UUID)
     print_to_terminal("Monitoring IMU data... Press 'Stop' to end.", Fore.BLACK)
     try:
-        await client.start_notify(MOTION_MEASUREMENT_CHAR_UUID, imu_callback)
+        await router.start_notify(client, MOTION_MEASUREMENT_CHAR_UUID)
         while not stop_monitoring:
             await asyncio.sleep(0.1)
             if disconnect_event.is_set():
                 break
-        await client.stop_notify(MOTION_MEASUREMENT_CHAR_UUID)
+        await router.stop_notify(client, MOTION_MEASUREMENT_CHAR_UUID)
     except Exception as e:
         print_to_terminal(f"Failed to monitor IMU data: {e}", Fore.RED)
     recording = False
+    print_lag_counters(MOTION_MEASUREMENT_CHAR_UUID)
+    if imu_publisher:
+        stats = imu_publisher.stats()
+        print_to_terminal(
+            f"IMU stream: clients={stats['clients']}, frames_sent={stats['frames_sent']}, "
+            f"frames_dropped={stats['frames_dropped']}, clients_dropped={stats['clients_dropped']}, "
+            f"short_payloads={stats['short_payloads']}, publish_errors={stats['publish_errors']}", Fore.CYAN
+        )
+
+def start_imu_publisher():
+    global imu_publisher
+    if not IMU_STREAM_URL:
+        return
+    consumer = router.subscribe(MOTION_MEASUREMENT_CHAR_UUID, "publisher", threaded=False, policy=POLICY_DROP_OLDEST, maxsize=4096)
+    try:
+        imu_publisher = IMUStreamPublisher(IMU_STREAM_URL, consumer, log=lambda message: print_to_terminal(message, Fore.CYAN))
+        imu_publisher.start()
+        print_to_terminal(f"IMU stream publishing on {IMU_STREAM_URL}", Fore.GREEN)
+    except (OSError, ValueError) as e:
+        imu_publisher = None
+        router.unsubscribe(MOTION_MEASUREMENT_CHAR_UUID, "publisher")
+        print_to_terminal(f"Failed to start IMU stream: {e}", Fore.RED)
+
+def stop_imu_publisher():
+    global imu_publisher
+    if imu_publisher:
+        imu_publisher.stop()
+        imu_publisher = None
+    router.unsubscribe(MOTION_MEASUREMENT_CHAR_UUID, "publisher")
 
 def log_mac_address(address):
     if os.path.exists(MAC_FILE_PATH):
@@ -500,17 +723,8 @@ class BLEMonitorApp:
         print_to_terminal(f"Configuring IMU: ACC_FSR={acc_fsr}, GYRO_FSR={gyr_fsr}, DATA_RATE={data_rate}", Fore.CYAN)
 
     def update_plot(self):
-        if not imu_queue.empty():
-            while not imu_queue.empty():
-                timestamp, ax, ay, az, gx, gy, gz = imu_queue.get()
-                imu_data["timestamps"].append(timestamp)
-                imu_data["ax"].append(ax)
-                imu_data["ay"].append(ay)
-                imu_data["az"].append(az)
-                imu_data["gx"].append(gx)
-                imu_data["gy"].append(gy)
-                imu_data["gz"].append(gz)
-
+        # 數據由 recorder 寫入 imu_data，plot 只需知道是否有新資料
+        if plot_consumer.drain():
             self.ax1.clear()
             self.ax2.clear()
             self.ax1.plot(imu_data["ax"], label='AX')
@@ -572,6 +786,8 @@ class BLEMonitorApp:
             disconnect_event.clear()
             try:
                 connected_device = BleakClient(address)
+                if imu_publisher:
+                    imu_publisher.set_address(address)
                 async with connected_device:
                     print_to_terminal(f"Connected to {address}", Fore.GREEN)
                     await read_battery_level(connected_device)
@@ -615,9 +831,12 @@ class BLEMonitorApp:
         save_thread.start()
 
     def _save_data_to_file(self):
+        with imu_data_lock:
+            rows = list(zip(imu_data["timestamps"], imu_data["ax"], imu_data["ay"], imu_data["az"],
+                            imu_data["gx"], imu_data["gy"], imu_data["gz"]))
         with open(f"IMU_Data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt", 'w') as f:
-            for i in range(len(imu_data["timestamps"])):
-                f.write(f"{imu_data['timestamps'][i]},{imu_data['ax'][i]},{imu_data['ay'][i]},{imu_data['az'][i]},{imu_data['gx'][i]},{imu_data['gy'][i]},{imu_data['gz'][i]}\n")
+            for row in rows:
+                f.write(",".join(str(value) for value in row) + "\n")
         print_to_terminal("IMU data saved to file.", Fore.GREEN)
 
         # 如果有連接的設備，將 MAC 地址記錄到文件中並更新列表
@@ -627,13 +846,14 @@ class BLEMonitorApp:
             self.update_mac_list()
 
     def clear_plot(self):
-        imu_data["timestamps"].clear()
-        imu_data["ax"].clear()
-        imu_data["ay"].clear()
-        imu_data["az"].clear()
-        imu_data["gx"].clear()
-        imu_data["gy"].clear()
-        imu_data["gz"].clear()
+        with imu_data_lock:
+            imu_data["timestamps"].clear()
+            imu_data["ax"].clear()
+            imu_data["ay"].clear()
+            imu_data["az"].clear()
+            imu_data["gx"].clear()
+            imu_data["gy"].clear()
+            imu_data["gz"].clear()
         self.ax1.clear()
         self.ax2.clear()
         self.canvas.draw()
@@ -657,8 +877,8 @@ class BLEMonitorApp:
         global connected_device
         try:
             if connected_device.is_connected:
-                await connected_device.stop_notify(BUTTON_CHAR_UUID)
-                await connected_device.stop_notify(MOTION_MEASUREMENT_CHAR_UUID)
+                await router.stop_notify(connected_device, BUTTON_CHAR_UUID)
+                await router.stop_notify(connected_device, MOTION_MEASUREMENT_CHAR_UUID)
                 await connected_device.disconnect()
         except Exception as e:
             print_to_terminal(f"Failed to stop notifications or disconnect: {e}", Fore.RED)
@@ -670,6 +890,8 @@ class BLEMonitorApp:
         self.disconnect_device()
         if self.ble_thread and self.ble_thread.is_alive():
             self.ble_thread.join()
+        stop_imu_publisher()
+        router.close()
         self.root.quit()
 
     def reset_checkbuttons(self):
@@ -692,4 +914,5 @@ class BLEMonitorApp:
 if __name__ == "__main__":
     root = tk.Tk()
     app = BLEMonitorApp(root)
+    start_imu_publisher()
     root.mainloop()